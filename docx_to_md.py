@@ -1,11 +1,37 @@
 import os
 import sys
+import json
+import logging
+import time
+import base64
+import argparse
+import shutil
+import socket
+import functools
+import contextlib
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-try:
-    import pypandoc
-except ImportError:
-    print("Error: 'pypandoc' library not found. Please install it using 'pip install pypandoc'.")
-    sys.exit(1)
+from log_utils import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Resolved once at import. pypandoc re-discovers pandoc and runs it twice
+# (--list-input-formats / --list-output-formats) before every conversion,
+# so we call the binary directly instead.
+PANDOC_PATH = shutil.which('pandoc')
+
+@functools.lru_cache(maxsize=None)
+def get_pandoc_version():
+    """
+    Returns the installed pandoc version string. The result is cached.
+    """
+    if PANDOC_PATH is None:
+        raise OSError("pandoc not found")
+    result = subprocess.run([PANDOC_PATH, '--version'], check=True, capture_output=True, text=True)
+    return result.stdout.split('\n', 1)[0].split()[-1]
 
 def ensure_pandoc_installed():
     """
@@ -13,48 +39,171 @@ def ensure_pandoc_installed():
     If not, prints an error message and exits.
     """
     try:
-        pypandoc.get_pandoc_version()
-    except OSError:
-        print("Error: 'pandoc' is not installed or not in your system's PATH.")
-        print("Please install pandoc from https://pandoc.org/installing.html")
+        get_pandoc_version()
+    except (OSError, subprocess.SubprocessError):
+        logger.error("Error: 'pandoc' is not installed or not in your system's PATH.")
+        logger.error("Please install pandoc from https://pandoc.org/installing.html")
         sys.exit(1)
 
-def convert_docx_to_markdown(directory='.'):
+# Talks to the local pandoc server directly, ignoring any http(s)_proxy settings
+_LOCAL_OPENER = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+@contextlib.contextmanager
+def pandoc_server(timeout=120):
+    """
+    Starts one long-lived 'pandoc server' (pandoc >= 3.0) on a free local port
+    and yields its URL, so conversions don't pay a pandoc startup each.
+    Yields None if the server is unavailable; callers then fall back to
+    running pandoc once per file.
+    """
+    if PANDOC_PATH is None:
+        yield None
+        return
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    url = f"http://127.0.0.1:{port}"
+
+    try:
+        proc = subprocess.Popen(
+            [PANDOC_PATH, 'server', '--port', str(port), '--timeout', str(timeout)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    except OSError:
+        yield None
+        return
+
+    try:
+        # Wait for the server to accept requests (or to exit if unsupported)
+        deadline = time.monotonic() + 5
+        ready = False
+        while not ready and proc.poll() is None and time.monotonic() < deadline:
+            try:
+                with _LOCAL_OPENER.open(f"{url}/version", timeout=1):
+                    ready = True
+            except OSError:
+                time.sleep(0.05)
+        yield url if ready else None
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def _convert_via_server(server_url, docx_path, md_path):
+    """
+    Converts a single .docx file to Markdown through a running pandoc server.
+    """
+    with open(docx_path, 'rb') as f:
+        # Binary input formats are sent base64-encoded
+        text = base64.b64encode(f.read()).decode('ascii')
+    payload = json.dumps({'text': text, 'from': 'docx', 'to': 'gfm', 'wrap': 'none'}).encode('utf-8')
+    request = urllib.request.Request(server_url, data=payload, headers={
+        'Content-Type': 'application/json',
+        'Accept': 'application/json'
+    })
+    try:
+        with _LOCAL_OPENER.open(request) as response:
+            result = json.load(response)
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(e.read().decode('utf-8', 'replace').strip() or str(e))
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+
+    output = result['output']
+    with open(md_path, 'w', encoding='utf-8') as f:
+        f.write(output if output.endswith('\n') else output + '\n')
+
+def _convert_one(docx_path, md_path, server_url=None):
+    """
+    Converts a single .docx file to Markdown. Runs inside a worker thread.
+    """
+    if server_url:
+        _convert_via_server(server_url, docx_path, md_path)
+        return
+
+    if PANDOC_PATH is None:
+        raise OSError("pandoc is not installed or not in your system's PATH")
+
+    # Using 'gfm' (GitHub-Flavored Markdown) for better table/strikethrough support.
+    # '--wrap=none' helps preserve line breaks better.
+    cmd = [PANDOC_PATH, '-f', 'docx', '-t', 'gfm', '--wrap=none', '-o', md_path, docx_path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"pandoc exited with status {result.returncode}")
+
+def _is_up_to_date(entry, md_path):
+    """
+    True if md_path exists and is at least as new as the .docx DirEntry.
+    """
+    try:
+        return os.stat(md_path).st_mtime >= entry.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+def convert_docx_to_markdown(directory='.', max_workers=None, force=False):
     """
     Scans the specified directory for .docx files and converts them to Markdown.
 
     The output Markdown files will be saved in the same directory with the same
-    base name.
+    base name. Conversions go through a single pandoc server when available
+    (one pandoc startup in total), otherwise one pandoc subprocess per file.
+    Either way files are converted concurrently on a thread pool (the GIL is
+    released while waiting on pandoc). max_workers defaults to the number
+    of CPUs.
+
+    Files whose .md is already newer than the .docx are skipped unless
+    force is set.
     """
-    print(f"Scanning for .docx files in '{os.path.abspath(directory)}'...")
+    logger.info("Scanning for .docx files in '%s'...", os.path.abspath(directory))
     
-    files_found = False
-    for filename in os.listdir(directory):
-        if filename.endswith(".docx"):
-            files_found = True
-            docx_path = os.path.join(directory, filename)
-            base_name = os.path.splitext(filename)[0]
-            # md_path = os.path.join(base_path, f"{base_name}.md")
-            # Use the docx file path as the current path where this file is located
-            md_path = os.path.join(directory, f"{base_name}.md")
-            
-            print(f"Converting '{docx_path}' to '{md_path}'...")
-            
+    jobs = []
+    up_to_date = 0
+    # Use the docx file path as the current path where this file is located
+    out_prefix = os.path.join(directory, '')
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(".docx"):
+                md_path = out_prefix + entry.name.rpartition('.')[0] + ".md"
+                if not force and _is_up_to_date(entry, md_path):
+                    up_to_date += 1
+                    continue
+                jobs.append((entry.name, entry.path, md_path))
+
+    if up_to_date:
+        logger.info("Skipping %s file(s) whose Markdown is already up to date.", up_to_date)
+    if not jobs:
+        if not up_to_date:
+            logger.info("No .docx files found in the current directory.")
+        return
+
+    with pandoc_server() as server_url, \
+            ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = {}
+        for filename, docx_path, md_path in jobs:
+            logger.debug("Converting '%s' to '%s'...", docx_path, md_path)
+            futures[executor.submit(_convert_one, docx_path, md_path, server_url)] = filename
+
+        for future in as_completed(futures):
+            filename = futures[future]
             try:
-                # Using 'gfm' (GitHub-Flavored Markdown) for better table/strikethrough support.
-                # '--wrap=none' helps preserve line breaks better.
-                extra_args = ['--wrap=none']
-                pypandoc.convert_file(docx_path, 'gfm', outputfile=md_path, extra_args=extra_args)
-                print(f"Successfully converted '{filename}'.")
+                future.result()
+                logger.info("Successfully converted '%s'.", filename)
             except Exception as e:
-                print(f"Error converting '{filename}': {e}")
-
-    if not files_found:
-        print("No .docx files found in the current directory.")
+                logger.error("Error converting '%s': %s", filename, e)
 
 if __name__ == "__main__":
-    ensure_pandoc_installed()
-    # The script will convert .docx files located in its own directory.
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    print(f"Target directory for conversion: {script_dir}")
-    convert_docx_to_markdown(script_dir)
+    parser = argparse.ArgumentParser(description="Convert .docx files next to this script to Markdown.")
+    parser.add_argument('--force', action='store_true',
+                        help="convert every file, even if its .md is newer than the .docx")
+    parser.add_argument('-v', '--verbose', action='store_true', help="also log per-file progress")
+    args = parser.parse_args()
+
+    listener = configure_logging(logger, args.verbose)
+    try:
+        ensure_pandoc_installed()
+        # The script will convert .docx files located in its own directory.
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        logger.info("Target directory for conversion: %s", script_dir)
+        convert_docx_to_markdown(script_dir, force=args.force)
+    finally:
+        listener.stop()
@@ -0,0 +1,24 @@
+import sys
+import queue
+import logging
+import logging.handlers
+
+def configure_logging(logger, verbose=False):
+    """
+    Send log records through a queue to a single thread writing to stdout,
+    so concurrent conversions never contend on the terminal. verbose turns
+    on debug output for logger (the calling script's own), not for the
+    libraries it uses.
+    Returns the started QueueListener; stop() it before exiting to flush.
+    """
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(logging.INFO)
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    return listener
@@ -1,10 +1,30 @@
 #!/usr/bin/env python3
 
+import io
 import os
+import re
 import sys
-import base64
+import json
+import time
+import logging
+import logging.handlers
+import atexit
+import shutil
+import asyncio
+import argparse
+import hashlib
+import functools
+import tempfile
+import threading
+import multiprocessing
 import subprocess
+import urllib.parse
+import urllib.request
+from html import escape
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from log_utils import configure_logging
 
 try:
     import markdown
@@ -15,15 +35,36 @@ except ImportError:
     import markdown
     import jinja2
 
-# HTML template with CSS for nice formatting
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{{ title }}</title>
-    <style>
+logger = logging.getLogger(__name__)
+
+# markdown-it-py is a much faster tokenizer-based parser; Python-Markdown
+# remains the fallback when it (or Pygments) is not installed
+try:
+    from markdown_it import MarkdownIt
+    from mdit_py_plugins.anchors import anchors_plugin
+    from mdit_py_plugins.front_matter import front_matter_plugin
+    from markdown.extensions import toc
+    from pygments import highlight
+    from pygments.lexers import get_lexer_by_name
+    from pygments.formatters import HtmlFormatter
+    from pygments.util import ClassNotFound
+except ImportError:
+    MarkdownIt = None
+
+# WeasyPrint renders in-process; without it we fall back to a headless browser
+try:
+    from weasyprint import HTML, CSS, __version__ as WEASYPRINT_VERSION
+except (ImportError, OSError):
+    HTML = CSS = WEASYPRINT_VERSION = None
+
+# Pillow is optional; without it images are passed through untouched
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:
+    Image = None
+
+# CSS for nice formatting
+STYLESHEET = """
         @page {
             size: A4;
             margin: 1.5cm;
@@ -142,7 +183,10 @@ HTML_TEMPLATE = """
             font-weight: bold;
             margin-bottom: 0.5em;
         }
-        /* Code Highlighting */
+"""
+
+# Code highlighting; only needed by pages that contain a codehilite block
+CODEHILITE_STYLESHEET = """
         .codehilite .hll { background-color: #ffffcc }
         .codehilite .c { color: #408080; font-style: italic } /* Comment */
         .codehilite .k { color: #008000; font-weight: bold } /* Keyword */
@@ -171,150 +215,824 @@ HTML_TEMPLATE = """
         .codehilite .kt { color: #B00040 } /* Keyword.Type */
         .codehilite .m { color: #666666 } /* Literal.Number */
         .codehilite .s { color: #BA2121 } /* Literal.String */
-    </style>
+"""
+
+# Stylesheet file names written into the output directory for the browser
+STYLESHEET_FILENAME = "style.css"
+CODEHILITE_STYLESHEET_FILENAME = "codehilite.css"
+
+# HTML page template; stylesheets are only linked for the browser fallback
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{{ title }}</title>
+    {% for href in stylesheets %}
+    <link rel="stylesheet" href="{{ href }}">
+    {% endfor %}
 </head>
 <body>
     <div class="container">
-        {{ content }}
+        {{ content | safe }}
     </div>
 </body>
 </html>
 """
 
+# Markdown extensions, registered once on the shared converter below
+EXTENSIONS = [
+    'markdown.extensions.tables',
+    'markdown.extensions.fenced_code',
+    'markdown.extensions.codehilite',
+    'markdown.extensions.toc',
+    'markdown.extensions.nl2br',
+    'markdown.extensions.sane_lists',
+    'markdown.extensions.smarty'
+]
+
+# Never run Pygments' slow lexer guessing on fences without a language
+EXTENSION_CONFIGS = {
+    'markdown.extensions.codehilite': {'guess_lang': False}
+}
+
+# Compiled once and reused for every file
+_TEMPLATE = jinja2.Environment(autoescape=True).from_string(HTML_TEMPLATE)
+
+# One formatter and one lexer per language, shared by every code block
+_FORMATTER = HtmlFormatter(nowrap=True) if MarkdownIt else None
+
+@functools.lru_cache(maxsize=32)
+def _get_lexer(lang):
+    """
+    Pygments lexer for a fence language, or None if there is no such lexer
+    """
+    try:
+        return get_lexer_by_name(lang)
+    except ClassNotFound:
+        return None
+
+def _highlight_fence(code, lang, attrs):
+    """
+    markdown-it highlight callback producing the same codehilite markup
+    classes as Python-Markdown, so the stylesheet applies unchanged
+    """
+    lexer = _get_lexer(lang) if lang else None
+    if lexer is None:
+        return ""
+    body = highlight(code, lexer, _FORMATTER)
+    return f'<pre class="codehilite"><code class="language-{escape(lang)}">{body}</code></pre>'
+
+# The dashes and ellipses smarty converts. markdown-it's own replacements
+# rule is not used as it also rewrites (c), (tm), +- and repeated punctuation.
+_SMARTY_DASHES_RE = re.compile(r'---|--|\.\.\.')
+_SMARTY_DASHES = {'---': '—', '--': '–', '...': '…'}
+
+def _smarty_dashes(state):
+    """
+    markdown-it core rule converting --, --- and ... in text like smarty
+    """
+    for token in state.tokens:
+        if token.type != 'inline' or not token.children:
+            continue
+        inside_autolink = 0
+        for child in token.children:
+            if child.type == 'text' and not inside_autolink:
+                child.content = _SMARTY_DASHES_RE.sub(lambda m: _SMARTY_DASHES[m.group()], child.content)
+            elif child.type == 'link_open' and child.info == 'auto':
+                inside_autolink += 1
+            elif child.type == 'link_close' and child.info == 'auto':
+                inside_autolink -= 1
+
+# Heading ids already used by the document being rendered on this thread
+_HEADING_IDS = threading.local()
+
+def _reset_heading_ids(state):
+    """
+    markdown-it core rule starting each document with no heading ids used
+    """
+    _HEADING_IDS.used = set()
+
+def _heading_id(title):
+    """
+    anchors slug_func producing the toc extension's ids, including its
+    _1, _2 suffixes for repeated headings, so existing links keep working
+    """
+    return toc.unique(toc.slugify(title, '-'), _HEADING_IDS.used)
+
+def _build_md_it():
+    """
+    markdown-it parser with options mirroring the Python-Markdown extensions:
+    breaks ~ nl2br, smartquotes plus _smarty_dashes ~ smarty, anchors ~ toc
+    """
+    md = (
+        MarkdownIt('commonmark', {'html': True, 'breaks': True, 'typographer': True,
+                                  'highlight': _highlight_fence})
+        .enable(['table', 'strikethrough', 'smartquotes'])
+        .use(anchors_plugin, max_level=6, slug_func=_heading_id)
+        .use(front_matter_plugin)
+    )
+    md.core.ruler.before('smartquotes', 'smarty_dashes', _smarty_dashes)
+    md.core.ruler.before('anchor', 'reset_heading_ids', _reset_heading_ids)
+    return md
+
+# Shared markdown-it parser; rendering keeps no state on it, so it is safe
+# to use from any thread
+_MD_IT = _build_md_it() if MarkdownIt else None
+
+# Cheap substring tests deciding whether an optional extension can affect a
+# document. They may over-trigger but never under-trigger, so skipping an
+# extension never changes the output.
+_SETEXT_RE = re.compile(r'^[ \t>]*(=+|-+)[ \t]*$', re.M)
+_SMARTY_TRIGGERS = ("'", '"', '--', '...', '. . .', '<<', '>>')
+
+def select_extensions(md_content):
+    """
+    Return the subset of EXTENSIONS (in order) the document actually needs,
+    so e.g. plain prose never loads Pygments or builds a TOC
+    """
+    has_fence = '```' in md_content or '~~~' in md_content
+    needed = {
+        'markdown.extensions.tables': '|' in md_content,
+        'markdown.extensions.fenced_code': has_fence,
+        'markdown.extensions.codehilite': has_fence or '    ' in md_content or '\t' in md_content,
+        'markdown.extensions.toc': ('#' in md_content or '[TOC]' in md_content
+                                    or _SETEXT_RE.search(md_content) is not None),
+        'markdown.extensions.smarty': any(t in md_content for t in _SMARTY_TRIGGERS),
+    }
+    return tuple(ext for ext in EXTENSIONS if needed.get(ext, True))
+
+def _build_markdown(extensions):
+    return markdown.Markdown(extensions=list(extensions), extension_configs=EXTENSION_CONFIGS,
+                             output_format='html5')
+
+# Markdown instances carry per-document state and are not thread-safe,
+# so each thread (and each worker process) keeps its own small cache of
+# converters, one per extension combination seen
+_LOCAL = threading.local()
+
+def get_markdown(extensions=tuple(EXTENSIONS)):
+    """
+    Return this thread's Markdown converter for the given extensions,
+    reset and ready for a new document
+    """
+    factory = getattr(_LOCAL, "factory", None)
+    if factory is None:
+        factory = _LOCAL.factory = functools.lru_cache(maxsize=16)(_build_markdown)
+    return factory(tuple(extensions)).reset()
+
+# Parsed once and shared by every WeasyPrint render
+_CSS = CSS(string=STYLESHEET) if CSS else None
+_CODEHILITE_CSS = CSS(string=CODEHILITE_STYLESHEET) if CSS else None
+
+def _weasyprint_options(version):
+    """
+    write_pdf keyword arguments for image optimization. The option was
+    optimize_size=(...) from WeasyPrint 53 and optimize_images from 59;
+    older releases accept neither.
+    """
+    try:
+        major = int(version.split('.')[0])
+    except (AttributeError, ValueError):
+        return {}
+    if major >= 59:
+        return {'optimize_images': True}
+    if major >= 53:
+        return {'optimize_size': ('fonts', 'images')}
+    return {}
+
+_WEASYPRINT_OPTIONS = _weasyprint_options(WEASYPRINT_VERSION)
+
+# Sidecar file in the output directory recording what each PDF was built from
+CACHE_FILENAME = ".md2pdf-cache.json"
+
+def load_cache(output_dir):
+    """
+    Load the {md_path: {hash, pdf_mtime}} conversion cache, or {} if absent
+    """
+    try:
+        with open(os.path.join(output_dir, CACHE_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(output_dir, cache):
+    """
+    Write the conversion cache back to the output directory
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, CACHE_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+
+def content_hash(md_content):
+    """
+    Short, fast digest of the markdown source used as the cache key
+    """
+    return hashlib.blake2b(md_content.encode("utf-8"), digest_size=16).hexdigest()
+
+def is_up_to_date(cache, md_file_path, digest, pdf_path):
+    """
+    True if pdf_path was produced from this exact content and is still on disk
+    """
+    entry = cache.get(os.path.abspath(md_file_path))
+    if not entry or entry.get("hash") != digest:
+        return False
+    try:
+        return os.path.getmtime(pdf_path) >= entry.get("pdf_mtime", 0)
+    except OSError:
+        return False
+
+# Candidate Chrome/Chromium binaries, resolved once at import
+CHROME_PATHS = [
+    "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+    "/usr/bin/google-chrome",
+    "/usr/bin/chromium",
+]
+CHROME_PATH = next((path for path in CHROME_PATHS if os.path.exists(path)), None)
+FIREFOX_PATH = shutil.which("firefox")
+
+# Per-process scratch directory for HTML pages handed to the browser
+_TEMP_DIR = None
+
+def _write_temp_html(html_content):
+    """
+    Write html_content to a uniquely named file and return its path.
+    The caller is responsible for removing it.
+    """
+    global _TEMP_DIR
+    if _TEMP_DIR is None:
+        _TEMP_DIR = tempfile.mkdtemp(prefix="md2pdf-")
+        atexit.register(shutil.rmtree, _TEMP_DIR, ignore_errors=True)
+    fd, html_path = tempfile.mkstemp(suffix=".html", dir=_TEMP_DIR)
+    with os.fdopen(fd, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.write(html_content)
+    return html_path
+
+def _chrome_command(html_path, output_path):
+    """
+    Build the headless Chrome command line that prints html_path to output_path
+    """
+    return [
+        CHROME_PATH,
+        "--headless",
+        "--disable-gpu",
+        "--no-sandbox",
+        "--print-to-pdf=" + output_path,
+        Path(html_path).as_uri()
+    ]
+
+def _firefox_command(html_path, output_path):
+    """
+    Build the headless Firefox command line that prints html_path to output_path
+    """
+    return [
+        FIREFOX_PATH,
+        "--headless",
+        "--print-to-pdf=" + output_path,
+        Path(html_path).as_uri()
+    ]
+
+def create_pdf_with_firefox(html_content, output_path):
+    """
+    Convert HTML to PDF using Firefox in headless mode
+    """
+    try:
+        if FIREFOX_PATH:
+            html_path = _write_temp_html(html_content)
+            try:
+                subprocess.run(_firefox_command(html_path, output_path), check=True, capture_output=True)
+            finally:
+                os.unlink(html_path)
+            logger.debug("✓ Created PDF using Firefox: %s", output_path)
+            return True
+    except (subprocess.SubprocessError, FileNotFoundError) as e:
+        logger.warning("Firefox conversion failed: %s", e)
+    
+    logger.error("❌ Failed to convert HTML to PDF. Please install Chrome or Firefox.")
+    return False
+
+def create_pdf_with_weasyprint(html_content, output_path):
+    """
+    Convert HTML to PDF in-process using WeasyPrint
+    """
+    try:
+        stylesheets = [_CSS]
+        if 'class="codehilite"' in html_content:
+            stylesheets.append(_CODEHILITE_CSS)
+        HTML(string=html_content).write_pdf(output_path, stylesheets=stylesheets, **_WEASYPRINT_OPTIONS)
+        logger.debug("✓ Created PDF using WeasyPrint: %s", output_path)
+        return True
+    except Exception as e:
+        logger.warning("WeasyPrint conversion failed: %s", e)
+        return False
+
+def _inline_stylesheets(html_content):
+    """
+    Embed the stylesheets in a page rendered for WeasyPrint, which links
+    none, so that a browser can print it instead
+    """
+    css = STYLESHEET
+    if 'class="codehilite"' in html_content:
+        css += CODEHILITE_STYLESHEET
+    return html_content.replace("</head>", f"<style>{css}</style>\n</head>", 1)
+
 def create_pdf_from_html(html_content, output_path):
+    """
+    Convert HTML to PDF using WeasyPrint if installed, falling back to
+    Chrome or Firefox in headless mode
+    """
+    if HTML is not None:
+        if create_pdf_with_weasyprint(html_content, output_path):
+            return True
+        html_content = _inline_stylesheets(html_content)
+    return _create_pdf_with_browser(html_content, output_path)
+
+def _create_pdf_with_browser(html_content, output_path):
     """
     Convert HTML to PDF using Chrome or Firefox in headless mode
     """
     # First, try Chrome
     try:
-        chrome_paths = [
-            "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
-            "/usr/bin/google-chrome",
-            "/usr/bin/chromium",
-        ]
-        chrome_path = None
-        for path in chrome_paths:
-            if os.path.exists(path):
-                chrome_path = path
-                break
-                
-        if chrome_path:
-            cmd = [
-                chrome_path,
-                "--headless",
-                "--disable-gpu",
-                "--no-sandbox",
-                "--print-to-pdf=" + output_path,
-                "data:text/html;base64," + base64.b64encode(html_content.encode()).decode()
-            ]
-            subprocess.run(cmd, check=True, capture_output=True)
-            print(f"✓ Created PDF using Chrome: {output_path}")
+        if CHROME_PATH:
+            html_path = _write_temp_html(html_content)
+            try:
+                subprocess.run(_chrome_command(html_path, output_path), check=True, capture_output=True)
+            finally:
+                os.unlink(html_path)
+            logger.debug("✓ Created PDF using Chrome: %s", output_path)
             return True
     except (subprocess.SubprocessError, FileNotFoundError) as e:
-        print(f"Chrome conversion failed: {str(e)}")
+        logger.warning("Chrome conversion failed: %s", e)
     
     # Try using Firefox if Chrome failed
+    return create_pdf_with_firefox(html_content, output_path)
+
+async def _print_with_browser_async(command, html_content, output_path):
+    """
+    Write html_content to a temp file and run command (built by
+    _chrome_command or _firefox_command) on it without blocking the loop
+    """
+    html_path = _write_temp_html(html_content)
     try:
-        if shutil.which("firefox"):
-            with open("temp.html", "wb") as f:
-                f.write(html_content.encode('utf-8'))
-                
-            cmd = [
-                "firefox",
-                "--headless",
-                "--print-to-pdf=" + output_path,
-                os.path.abspath("temp.html")
-            ]
-            subprocess.run(cmd, check=True, capture_output=True)
-            os.remove("temp.html")
-            print(f"✓ Created PDF using Firefox: {output_path}")
+        cmd = command(html_path, output_path)
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await proc.communicate()
+    finally:
+        os.unlink(html_path)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd[0], stderr=stderr)
+
+async def _create_pdf_with_browser_async(html_content, output_path):
+    """
+    Convert HTML to PDF using Chrome or Firefox, spawned with asyncio
+    """
+    try:
+        if CHROME_PATH:
+            await _print_with_browser_async(_chrome_command, html_content, output_path)
+            logger.debug("✓ Created PDF using Chrome: %s", output_path)
             return True
     except (subprocess.SubprocessError, FileNotFoundError) as e:
-        print(f"Firefox conversion failed: {str(e)}")
-        os.remove("temp.html") if os.path.exists("temp.html") else None
+        logger.warning("Chrome conversion failed: %s", e)
     
-    print("❌ Failed to convert HTML to PDF. Please install Chrome or Firefox.")
+    # Try using Firefox if Chrome failed
+    try:
+        if FIREFOX_PATH:
+            await _print_with_browser_async(_firefox_command, html_content, output_path)
+            logger.debug("✓ Created PDF using Firefox: %s", output_path)
+            return True
+    except (subprocess.SubprocessError, FileNotFoundError) as e:
+        logger.warning("Firefox conversion failed: %s", e)
+    
+    logger.error("❌ Failed to convert HTML to PDF. Please install Chrome or Firefox.")
     return False
 
-def convert_md_to_pdf(md_file_path, output_dir):
+def _init_worker_logging(log_queue, level):
+    """
+    ProcessPoolExecutor initializer: ship all worker log records back to
+    the parent process through log_queue
+    """
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(logging.INFO)
+    logger.setLevel(level)
+
+def write_stylesheets(output_dir, overwrite=True):
+    """
+    Write the stylesheets linked by browser-rendered pages into output_dir.
+    With overwrite=False only missing files are written. Not needed when
+    WeasyPrint is used, as it gets the parsed CSS directly.
+    """
+    if _CSS is not None:
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    for filename, css in ((STYLESHEET_FILENAME, STYLESHEET),
+                          (CODEHILITE_STYLESHEET_FILENAME, CODEHILITE_STYLESHEET)):
+        path = os.path.join(output_dir, filename)
+        if not overwrite and os.path.exists(path):
+            continue
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(css)
+
+def _stylesheet_links(output_dir, html_body):
     """
-    Convert markdown to PDF with proper formatting
+    Absolute URLs of the stylesheets a page needs. The page itself is loaded
+    from a temp directory, so relative links would not resolve.
+    """
+    if _CSS is not None:
+        return []
+    links = [Path(output_dir, STYLESHEET_FILENAME).resolve().as_uri()]
+    if 'class="codehilite"' in html_body:
+        links.append(Path(output_dir, CODEHILITE_STYLESHEET_FILENAME).resolve().as_uri())
+    return links
+
+# Images are downscaled to the page width and stored once per unique content
+IMAGE_MAX_WIDTH = 1200
+IMAGE_CACHE_DIRNAME = ".md2pdf-images"
+_IMG_SRC_RE = re.compile(r'(<img[^>]+src=")([^"]+)')
+
+# After a failed download, don't retry the same URL for this many seconds
+IMAGE_FETCH_RETRY_SECONDS = 600
+
+# Resolved image source -> optimized file URI (or None if it can't be optimized)
+_OPTIMIZED_IMAGES = {}
+
+def _read_local_image(src, base_dir):
     """
+    Return the raw bytes of a local image referenced from a page, or None
+    """
+    parsed = urllib.parse.urlparse(src)
+    if parsed.scheme == "file":
+        path = urllib.parse.unquote(parsed.path)
+    elif not parsed.scheme:
+        path = os.path.join(base_dir, urllib.parse.unquote(parsed.path))
+    else:
+        # data: URLs and anything else are left alone
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+def _fetch_remote_image(src, key, cache_dir):
+    """
+    Download a remote image. Failures are remembered on disk for
+    IMAGE_FETCH_RETRY_SECONDS so other workers and runs don't wait on the
+    same timeout; returns None while that marker is fresh.
+    """
+    marker = os.path.join(cache_dir, key + ".failed")
     try:
-        # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Output PDF path
-        base_name = os.path.splitext(os.path.basename(md_file_path))[0]
-        pdf_path = os.path.join(output_dir, base_name + ".pdf")
-        
-        # Read markdown content
-        with open(md_file_path, "r", encoding="utf-8") as f:
-            md_content = f.read()
-        
-        # Convert to HTML using Python Markdown
-        extensions = [
-            'markdown.extensions.tables',
-            'markdown.extensions.fenced_code',
-            'markdown.extensions.codehilite',
-            'markdown.extensions.toc',
-            'markdown.extensions.nl2br',
-            'markdown.extensions.sane_lists',
-            'markdown.extensions.smarty'
-        ]
-        
-        html_body = markdown.markdown(md_content, extensions=extensions)
+        if time.time() - os.path.getmtime(marker) < IMAGE_FETCH_RETRY_SECONDS:
+            return None
+    except OSError:
+        pass
+    try:
+        with urllib.request.urlopen(src, timeout=10) as response:
+            return response.read()
+    except OSError:
+        os.makedirs(cache_dir, exist_ok=True)
+        Path(marker).touch()
+        raise
+
+def _cached_image(cache_dir, key):
+    """
+    File URI of the optimized copy stored under key, or None
+    """
+    for ext in (".jpg", ".png"):
+        cached = os.path.join(cache_dir, key + ext)
+        if os.path.exists(cached):
+            return Path(cached).resolve().as_uri()
+    return None
+
+def _optimize_image(src, base_dir, cache_dir):
+    """
+    Downscale one image into cache_dir. Local images are keyed by a hash of
+    their content, remote ones by a hash of their URL so that a cached copy
+    is found without downloading again. Returns the file URI of the
+    optimized copy, or None to keep src as-is.
+    """
+    if urllib.parse.urlparse(src).path.lower().endswith(".svg"):
+        # Vector images need no downscaling and Pillow cannot read them
+        return None
+    
+    remote = src.startswith(("http://", "https://"))
+    if remote:
+        key = "url-" + hashlib.blake2b(src.encode("utf-8"), digest_size=16).hexdigest()
+        cached = _cached_image(cache_dir, key)
+        if cached:
+            return cached
+        if os.path.exists(os.path.join(cache_dir, key + ".skip")):
+            return None
+        data = _fetch_remote_image(src, key, cache_dir)
+    else:
+        data = _read_local_image(src, base_dir)
+        if data is not None:
+            key = hashlib.blake2b(data, digest_size=16).hexdigest()
+            cached = _cached_image(cache_dir, key)
+            if cached:
+                return cached
+    if data is None:
+        return None
+    
+    try:
+        img = Image.open(io.BytesIO(data))
+    except UnidentifiedImageError:
+        # Not a raster format (e.g. an SVG without the extension): keep src
+        # and remember a remote one so it is not downloaded again
+        logger.debug("- Not optimizing image %s (unsupported format)", src)
+        if remote:
+            os.makedirs(cache_dir, exist_ok=True)
+            Path(cache_dir, key + ".skip").touch()
+        return None
+    with img:
+        # Apply the EXIF orientation, which re-encoding would otherwise drop
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((IMAGE_MAX_WIDTH, IMAGE_MAX_WIDTH * 10))
+        if img.mode in ("RGBA", "LA", "P"):
+            ext, fmt, options = ".png", "PNG", {"optimize": True}
+        else:
+            img = img.convert("RGB")
+            ext, fmt, options = ".jpg", "JPEG", {"quality": 85, "optimize": True}
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write under a unique name first so concurrent writers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(suffix=ext, dir=cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            img.save(f, fmt, **options)
+    # mkstemp creates files as 0600; give the cached copy normal permissions
+    os.chmod(tmp_path, 0o644)
+    cached = os.path.join(cache_dir, key + ext)
+    os.replace(tmp_path, cached)
+    return Path(cached).resolve().as_uri()
+
+def optimize_images(html_body, base_dir, output_dir):
+    """
+    Point every <img> in html_body at a downscaled, deduplicated copy under
+    output_dir. Each unique source is only read and re-encoded once per run.
+    """
+    if Image is None or "<img" not in html_body:
+        return html_body
+    cache_dir = os.path.join(output_dir, IMAGE_CACHE_DIRNAME)
+    
+    def replace(match):
+        src = match.group(2)
+        key = (base_dir, src)
+        if key not in _OPTIMIZED_IMAGES:
+            try:
+                _OPTIMIZED_IMAGES[key] = _optimize_image(src, base_dir, cache_dir)
+            except Exception as e:
+                logger.warning("Could not optimize image %s: %s", src, e)
+                _OPTIMIZED_IMAGES[key] = None
+        return match.group(1) + (_OPTIMIZED_IMAGES[key] or src)
+    
+    return _IMG_SRC_RE.sub(replace, html_body)
+
+def markdown_to_html(md_content):
+    """
+    Convert markdown source to an HTML fragment with markdown-it-py, or
+    Python-Markdown if it is not available. Documents with a [TOC] marker
+    always use Python-Markdown, as only its toc extension expands it.
+    """
+    if _MD_IT is not None and '[TOC]' not in md_content:
+        return _MD_IT.render(md_content)
+    return get_markdown(select_extensions(md_content)).convert(md_content)
+
+def _stem(name):
+    """
+    File name without its extension
+    """
+    return name.rpartition('.')[0] or name
+
+def render_markdown(md_file_path, output_dir, pdf_path, cache=None):
+    """
+    Render a markdown file to a standalone HTML page for pdf_path, which
+    lies in output_dir.
+
+    Returns (html, digest); html is None when the cache shows
+    the existing PDF is already up to date.
+    """
+    # Create output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # Read markdown content
+    md_content = Path(md_file_path).read_text(encoding="utf-8")
+    
+    digest = content_hash(md_content)
+    if cache is not None and is_up_to_date(cache, md_file_path, digest, pdf_path):
+        return None, digest
+    
+    # Convert to HTML
+    html_body = markdown_to_html(md_content)
+    html_body = optimize_images(html_body, os.path.dirname(os.path.abspath(md_file_path)), output_dir)
+    
+    # Render with template
+    html = _TEMPLATE.render(
+        title=Path(pdf_path).stem,
+        content=html_body,
+        stylesheets=_stylesheet_links(output_dir, html_body)
+    )
+    return html, digest
+
+def _record_conversion(cache, md_file_path, digest, pdf_path):
+    """
+    Note a successful conversion in the cache and report it
+    """
+    if cache is not None:
+        cache[os.path.abspath(md_file_path)] = {
+            "hash": digest,
+            "pdf_mtime": os.path.getmtime(pdf_path)
+        }
+    logger.info("✓ Converted %s to %s", os.path.basename(md_file_path), pdf_path)
+
+def _pdf_is_newer(pdf_path, md_mtime):
+    """
+    True if pdf_path exists and is newer than md_mtime
+    """
+    try:
+        return os.stat(pdf_path).st_mtime >= md_mtime
+    except OSError:
+        return False
+
+def convert_md_to_pdf(md_file_path, output_dir, cache=None, force=False):
+    """
+    Convert markdown to PDF with proper formatting.
+
+    Files whose PDF is newer than the source are skipped. If a cache dict
+    (see load_cache) is given, files whose content hash matches the
+    recorded one and whose PDF still exists are skipped too, and the cache
+    is updated after each successful conversion. force disables both checks.
+    """
+    md_name = os.path.basename(md_file_path)
+    pdf_path = os.path.join(output_dir, _stem(md_name) + ".pdf")
+    try:
+        if not force and _pdf_is_newer(pdf_path, os.stat(md_file_path).st_mtime):
+            logger.debug("- Skipped %s (PDF is newer)", md_name)
+            return True
         
-        # Render with template
-        template = jinja2.Template(HTML_TEMPLATE)
-        html = template.render(
-            title=base_name,
-            content=html_body
-        )
+        # Callers converting many files refresh the stylesheets once themselves
+        write_stylesheets(output_dir, overwrite=False)
+        html, digest = render_markdown(md_file_path, output_dir, pdf_path, None if force else cache)
+        if html is None:
+            logger.debug("- Skipped %s (unchanged)", md_name)
+            return True
         
         # Convert to PDF
-        result = create_pdf_from_html(html, pdf_path)
-        if result:
-            print(f"✓ Converted {os.path.basename(md_file_path)} to {pdf_path}")
+        if create_pdf_from_html(html, pdf_path):
+            _record_conversion(cache, md_file_path, digest, pdf_path)
             return True
         return False
         
     except Exception as e:
-        print(f"✗ Error converting {md_file_path}: {str(e)}")
+        logger.error("✗ Error converting %s: %s", md_file_path, e)
         return False
 
-def scan_and_convert(folder_path, output_dir):
+def _render_worker(md_file_path, output_dir, pdf_path, cache_entry):
     """
-    Recursively scan for markdown files and convert them to PDFs
+    render_markdown for a worker process; only this file's cache entry is
+    shipped over rather than the whole cache
+    """
+    cache = {os.path.abspath(md_file_path): cache_entry} if cache_entry else {}
+    return render_markdown(md_file_path, output_dir, pdf_path, cache)
+
+# Outcomes reported by convert_md_to_pdf_async
+CONVERTED, SKIPPED, FAILED = "converted", "skipped", "failed"
+
+async def convert_md_to_pdf_async(md_file_path, output_dir, pdf_path, cache, semaphore, executor=None):
+    """
+    Asynchronous variant of convert_md_to_pdf, writing pdf_path.
+
+    Markdown is parsed on executor (a process pool; None means the loop's
+    default executor), then the PDF step runs under semaphore, which bounds
+    how many browser processes are in flight at once. Returns CONVERTED,
+    SKIPPED (the cache shows the PDF is up to date) or FAILED.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        html, digest = await loop.run_in_executor(
+            executor, _render_worker, md_file_path, output_dir, pdf_path,
+            cache.get(os.path.abspath(md_file_path))
+        )
+        if html is None:
+            logger.debug("- Skipped %s (unchanged)", os.path.basename(md_file_path))
+            return SKIPPED
+        
+        async with semaphore:
+            if HTML is not None:
+                # WeasyPrint is CPU-bound Python, so it goes to the pool as well
+                result = await loop.run_in_executor(executor, create_pdf_with_weasyprint, html, pdf_path)
+                if not result:
+                    result = await _create_pdf_with_browser_async(_inline_stylesheets(html), pdf_path)
+            else:
+                result = await _create_pdf_with_browser_async(html, pdf_path)
+        if result:
+            _record_conversion(cache, md_file_path, digest, pdf_path)
+            return CONVERTED
+        return FAILED
+        
+    except Exception as e:
+        logger.error("✗ Error converting %s: %s", md_file_path, e)
+        return FAILED
+
+def walk_markdown_files(root):
+    """
+    Recursively yield os.DirEntry objects for markdown files under root.
+    Symlinked directories are not followed and unreadable ones are skipped.
+    """
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk_markdown_files(entry.path)
+        elif entry.name.endswith('.md') and entry.is_file():
+            yield entry
+
+
+async def scan_and_convert(folder_path, output_dir, max_concurrency=None, force=False):
+    """
+    Recursively scan for markdown files and convert them to PDFs.
+
+    Markdown is parsed on a pool of max_concurrency (default: CPU count)
+    worker processes while up to as many PDFs are produced concurrently.
+    Unless force is set, files that are unchanged since their PDF was
+    produced are skipped. Returns (converted, failed); skipped files are
+    counted in neither.
     """
-    successful = 0
-    failed = 0
     md_files = []
+    up_to_date = 0
+    
+    # Find all markdown files, skipping those whose PDF is newer than the source
+    out_prefix = os.path.join(output_dir, '')
+    for entry in walk_markdown_files(folder_path):
+        pdf_path = out_prefix + _stem(entry.name) + ".pdf"
+        if not force and _pdf_is_newer(pdf_path, entry.stat().st_mtime):
+            up_to_date += 1
+        else:
+            md_files.append((entry.path, pdf_path))
     
-    # Find all markdown files
-    for path in Path(folder_path).rglob('*.md'):
-        md_files.append(str(path))
+    logger.info("Found %s markdown files in %s", len(md_files) + up_to_date, folder_path)
+    if up_to_date:
+        logger.info("Skipping %s files whose PDF is newer than the source", up_to_date)
     
-    print(f"Found {len(md_files)} markdown files in {folder_path}")
+    # Convert all found files, skipping ones unchanged since the last run
+    write_stylesheets(output_dir)
+    # A forced run rebuilds the cache from scratch
+    cache = {} if force else load_cache(output_dir)
+    concurrency = max_concurrency or os.cpu_count() or 1
+    semaphore = asyncio.Semaphore(concurrency)
+    # Bound how many rendered pages can wait for the PDF stage at once
+    pending = asyncio.Semaphore(2 * concurrency)
     
-    # Convert all found files
-    for md_file_path in md_files:
-        if convert_md_to_pdf(md_file_path, output_dir):
-            successful += 1
-        else:
-            failed += 1
+    # Worker log records are handed to this process's handlers by one listener
+    root = logging.getLogger()
+    # Spawn rather than fork: this process already runs the log listener threads
+    mp_context = multiprocessing.get_context("spawn")
+    log_queue = mp_context.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    listener.start()
+    try:
+        with ProcessPoolExecutor(max_workers=concurrency, mp_context=mp_context,
+                                 initializer=_init_worker_logging,
+                                 initargs=(log_queue, logger.getEffectiveLevel())) as executor:
+            async def convert(md_file_path, pdf_path):
+                async with pending:
+                    return await convert_md_to_pdf_async(md_file_path, output_dir, pdf_path,
+                                                         cache, semaphore, executor)
+            
+            results = await asyncio.gather(*(convert(md_file_path, pdf_path)
+                                             for md_file_path, pdf_path in md_files))
+    finally:
+        listener.stop()
+    save_cache(output_dir, cache)
     
-    print(f"\nSummary: {successful} files converted successfully, {failed} files failed")
+    successful = results.count(CONVERTED)
+    skipped = results.count(SKIPPED) + up_to_date
+    failed = results.count(FAILED)
+    logger.info("Summary: %s files converted successfully, %s skipped as up to date, %s files failed",
+                successful, skipped, failed)
     return successful, failed
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert markdown files to PDF.")
+    parser.add_argument('--force', action='store_true',
+                        help="convert every file, even if its PDF is up to date")
+    parser.add_argument('-v', '--verbose', action='store_true', help="also log per-file details")
+    args = parser.parse_args()
+    
     # Top level directory to scan
     script_dir = os.path.dirname(os.path.abspath(__file__))
     top_level_dir = os.path.abspath(os.path.join(script_dir, '../..'))
     
     output_dir = script_dir
     
-    print(f"Scanning for markdown files in: {top_level_dir}")
-    print(f"Saving PDFs to: {output_dir}\n")
-    
-    scan_and_convert(top_level_dir, output_dir)
+    listener = configure_logging(logger, args.verbose)
+    try:
+        logger.info("Scanning for markdown files in: %s", top_level_dir)
+        logger.info("Saving PDFs to: %s", output_dir)
+        
+        asyncio.run(scan_and_convert(top_level_dir, output_dir, force=args.force))
+    finally:
+        listener.stop()